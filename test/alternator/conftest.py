@@ -25,7 +25,7 @@
 import pytest
 import boto3
 import requests
-from util import create_test_table
+from util import create_test_table, batch_write
 
 # When tests are run with HTTPS, the server often won't have its SSL
 # certificate signed by a known authority. So we will disable certificate
@@ -84,6 +84,13 @@ def dynamodb(request):
     # only makes it impossible for us to test various error conditions,
     # because boto3 checks them before we can get the server to check them.
     boto_config = botocore.client.Config(parameter_validation=False)
+    # Some test utilities (e.g., full_scan() with segments, batch_write())
+    # send requests in parallel from several threads, so allow more than
+    # the default 10 pooled connections, and keep idle ones alive (the
+    # tcp_keepalive option only exists in newer versions of botocore).
+    boto_config = boto_config.merge(botocore.client.Config(max_pool_connections=64))
+    if 'tcp_keepalive' in botocore.client.Config.OPTION_DEFAULTS:
+        boto_config = boto_config.merge(botocore.client.Config(tcp_keepalive=True))
     if request.config.getoption('aws'):
         return boto3.resource('dynamodb', config=boto_config)
     else:
@@ -251,9 +258,7 @@ def filled_test_table(dynamodb):
     } for i in range(count)]
     items.append({'p': 'hello', 'c': 'world', 'str': 'and now for something completely different'})
 
-    with table.batch_writer() as batch:
-        for item in items:
-            batch.put_item(item)
+    batch_write(table, items)
 
     yield table, items
     table.delete()
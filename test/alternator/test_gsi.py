@@ -24,7 +24,7 @@
 import pytest
 import time
 from botocore.exceptions import ClientError
-from util import create_test_table, random_string, full_scan, full_query, multiset, list_tables, new_test_table
+from util import create_test_table, random_string, full_scan, full_query, iter_scan, iter_query, multiset, list_tables, new_test_table
 
 # GSIs only support eventually consistent reads, so tests that involve
 # writing to a table and then expect to read something from it cannot be
@@ -43,7 +43,7 @@ from util import create_test_table, random_string, full_scan, full_query, multis
 def assert_index_query(table, index_name, expected_items, **kwargs):
     expected = multiset(expected_items)
     for i in range(5):
-        got = multiset(full_query(table, IndexName=index_name, ConsistentRead=False, **kwargs))
+        got = multiset(iter_query(table, IndexName=index_name, ConsistentRead=False, **kwargs))
         if expected == got:
             return
         elif got - expected:
@@ -51,12 +51,12 @@ def assert_index_query(table, index_name, expected_items, **kwargs):
             pytest.fail("assert_index_query() found unexpected items: " + str(got - expected))
         print('assert_index_query retrying')
         time.sleep(1)
-    assert multiset(expected_items) == multiset(full_query(table, IndexName=index_name, ConsistentRead=False, **kwargs))
+    assert expected == multiset(full_query(table, IndexName=index_name, ConsistentRead=False, **kwargs))
 
 def assert_index_scan(table, index_name, expected_items, **kwargs):
     expected = multiset(expected_items)
     for i in range(5):
-        got =  multiset(full_scan(table, IndexName=index_name, ConsistentRead=False, **kwargs))
+        got = multiset(iter_scan(table, IndexName=index_name, ConsistentRead=False, **kwargs))
         if expected == got:
             return
         elif got - expected:
@@ -64,7 +64,7 @@ def assert_index_scan(table, index_name, expected_items, **kwargs):
             pytest.fail("assert_index_scan() found unexpected items: " + str(got - expected))
         print('assert_index_scan retrying')
         time.sleep(1)
-    assert multiset(expected_items) == multiset(full_scan(table, IndexName=index_name, ConsistentRead=False, **kwargs))
+    assert expected == multiset(full_scan(table, IndexName=index_name, ConsistentRead=False, **kwargs))
 
 # Although quite silly, it is actually allowed to create an index which is
 # identical to the base table.
@@ -318,12 +318,12 @@ def test_gsi_missing_attribute(test_table_gsi_2):
     # will).
     assert_index_query(test_table_gsi_2, 'hello', [{'p': p1, 'x': x1}],
         KeyConditions={'x': {'AttributeValueList': [x1], 'ComparisonOperator': 'EQ'}})
-    assert any([i['p'] == p1 for i in full_scan(test_table_gsi_2)])
+    assert any(i['p'] == p1 for i in iter_scan(test_table_gsi_2))
     # Note: with eventually consistent read, we can't really be sure that
     # and item will "never" appear in the index. We do this test last,
     # so if we had a bug and such item did appear, hopefully we had enough
     # time for the bug to become visible. At least sometimes.
-    assert not any([i['p'] == p2 for i in full_scan(test_table_gsi_2, ConsistentRead=False, IndexName='hello')])
+    assert not any(i['p'] == p2 for i in iter_scan(test_table_gsi_2, ConsistentRead=False, IndexName='hello'))
 
 # Test when a table has a GSI, if the indexed attribute has the wrong type,
 # the update operation is rejected, and is added to neither base table nor
@@ -457,15 +457,15 @@ def test_gsi_missing_attribute_3(test_table_gsi_3):
     # an item will "never" appear in the index. We hope that if a bug exists
     # and such an item did appear, sometimes the delay here will be enough
     # for the unexpected item to become visible.
-    assert not any([i['p'] == p for i in full_scan(test_table_gsi_3, ConsistentRead=False, IndexName='hello')])
+    assert not any(i['p'] == p for i in iter_scan(test_table_gsi_3, ConsistentRead=False, IndexName='hello'))
     # Same thing for an item with a missing "b" value:
     test_table_gsi_3.put_item(Item={'p':  p, 'a': a})
     assert test_table_gsi_3.get_item(Key={'p':  p}, ConsistentRead=True)['Item'] == {'p': p, 'a': a}
-    assert not any([i['p'] == p for i in full_scan(test_table_gsi_3, ConsistentRead=False, IndexName='hello')])
+    assert not any(i['p'] == p for i in iter_scan(test_table_gsi_3, ConsistentRead=False, IndexName='hello'))
     # And for an item missing both:
     test_table_gsi_3.put_item(Item={'p':  p})
     assert test_table_gsi_3.get_item(Key={'p':  p}, ConsistentRead=True)['Item'] == {'p': p}
-    assert not any([i['p'] == p for i in full_scan(test_table_gsi_3, ConsistentRead=False, IndexName='hello')])
+    assert not any(i['p'] == p for i in iter_scan(test_table_gsi_3, ConsistentRead=False, IndexName='hello'))
 
 # A fourth scenario of GSI. Two GSIs on a single base table.
 @pytest.fixture(scope="module")
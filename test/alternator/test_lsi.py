@@ -36,12 +36,13 @@ def assert_index_scan(table, index_name, expected_items, **kwargs):
 # A version doing retries instead of ConsistentRead, to be used just for the
 # one test below which has both GSI and LSI:
 def retrying_assert_index_query(table, index_name, expected_items, **kwargs):
+    expected = multiset(expected_items)
     for i in range(3):
-        if multiset(expected_items) == multiset(full_query(table, IndexName=index_name, ConsistentRead=False, **kwargs)):
+        if expected == multiset(full_query(table, IndexName=index_name, ConsistentRead=False, **kwargs)):
             return
         print('retrying_assert_index_query retrying')
         time.sleep(1)
-    assert multiset(expected_items) == multiset(full_query(table, IndexName=index_name, ConsistentRead=False, **kwargs))
+    assert expected == multiset(full_query(table, IndexName=index_name, ConsistentRead=False, **kwargs))
 
 # Although quite silly, it is actually allowed to create an index which is
 # identical to the base table.
@@ -254,6 +254,32 @@ def test_scan_parallel(filled_test_table):
         # in items was returned in one - and just one - of the segments.
         assert multiset(items) == multiset(got_items)
 
+# Same as test_scan_parallel, but actually running the segments in parallel
+# threads, using the "segments" option of full_scan() and
+# full_scan_and_count().
+def test_scan_parallel_concurrent(filled_test_table):
+    test_table, items = filled_test_table
+    for nsegments in [2, 17]:
+        print('Testing TotalSegments={}'.format(nsegments))
+        got_items = full_scan(test_table, segments=nsegments)
+        assert multiset(items) == multiset(got_items)
+        (got_count, got_items) = full_scan_and_count(test_table, segments=nsegments, Select='COUNT')
+        assert got_count == len(items)
+        assert got_items == []
+    # A string FilterExpression can be used with segments:
+    got_items = full_scan(test_table, segments=5, FilterExpression='#a = :x',
+        ExpressionAttributeNames={'#a': 'attribute'},
+        ExpressionAttributeValues={':x': 'xxxxx'})
+    expected_items = [item for item in items if item.get('attribute') == 'xxxxx']
+    assert multiset(expected_items) == multiset(got_items)
+    # But a FilterExpression built from boto3.dynamodb.conditions objects
+    # cannot, because boto3 builds these expressions using shared state
+    # which is not thread-safe:
+    with pytest.raises(TypeError, match='full_scan_and_count'):
+        full_scan_and_count(test_table, segments=5, FilterExpression=Attr('attribute').eq('xxxxx'))
+    with pytest.raises(TypeError, match=r'full_scan\(\)'):
+        full_scan(test_table, segments=5, FilterExpression=Attr('attribute').eq('xxxxx'))
+
 # Test correct handling of incorrect parallel scan parameters.
 # Most of the corner cases (like TotalSegments=0) are validated
 # by boto3 itself, but some checks can still be performed.
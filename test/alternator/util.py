@@ -21,14 +21,17 @@ import string
 import random
 import collections
 import time
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from botocore.hooks import HierarchicalEmitter
+from botocore.exceptions import ClientError
 
 def random_string(length=10, chars=string.ascii_uppercase + string.digits):
-    return ''.join(random.choice(chars) for x in range(length))
+    return ''.join(random.choices(chars, k=length))
 
 def random_bytes(length=10):
-    return bytearray(random.getrandbits(8) for _ in range(length))
+    return bytearray(random.getrandbits(length * 8).to_bytes(length, 'little'))
 
 # Utility functions for scan and query into an array of items, reading
 # the full (possibly requiring multiple requests to read successive pages).
@@ -36,45 +39,83 @@ def random_bytes(length=10):
 # need it to run correctly on a multi-node cluster. Callers who need to
 # override it, can (this is necessary in GSI tests, where ConsistentRead=True
 # is not supported).
-def full_scan(table, ConsistentRead=True, **kwargs):
-    response = table.scan(ConsistentRead=ConsistentRead, **kwargs)
-    items = response['Items']
-    while 'LastEvaluatedKey' in response:
-        response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'],
-            ConsistentRead=ConsistentRead, **kwargs)
-        items.extend(response['Items'])
-    return items
+# Note that successive pages cannot be requested concurrently (or pipelined),
+# as each request needs the LastEvaluatedKey returned by the previous one.
+# If segments=N is given, the scan is split into N segments (using DynamoDB's
+# Segment and TotalSegments parameters) which are read in parallel, and the
+# results are concatenated. The order of the returned items is then not the
+# same as in a serial scan. Because boto3 resources are not thread-safe
+# (building a FilterExpression from boto3.dynamodb.conditions objects uses
+# shared state), with segments the FilterExpression must be a string.
+# If page_size is given, it is used as the Limit of each request.
+def full_scan(table, ConsistentRead=True, segments=None, page_size=None, **kwargs):
+    if segments and 'Segment' not in kwargs and 'TotalSegments' not in kwargs:
+        results = _scan_segments(full_scan, table, segments,
+            ConsistentRead=ConsistentRead, page_size=page_size, **kwargs)
+        return list(itertools.chain.from_iterable(results))
+    return list(iter_scan(table, ConsistentRead, page_size, **kwargs))
+
+# iter_scan() is like full_scan(), but instead of returning a list of all
+# items, it returns an iterator which reads pages only as they are needed.
+# This is useful for callers which only need to go over the items once.
+def iter_scan(table, ConsistentRead=True, page_size=None, **kwargs):
+    for page in _paginate(table, 'scan', page_size,
+            ConsistentRead=ConsistentRead, **kwargs):
+        yield from page.get('Items', [])
 
 # full_scan_and_count returns both items and count as returned by the server.
 # Note that count isn't simply len(items) - the server returns them
 # independently. e.g., with Select='COUNT' the items are not returned, but
 # count is.
-def full_scan_and_count(table, ConsistentRead=True, **kwargs):
-    response = table.scan(ConsistentRead=ConsistentRead, **kwargs)
+def full_scan_and_count(table, ConsistentRead=True, segments=None, **kwargs):
+    if segments and 'Segment' not in kwargs and 'TotalSegments' not in kwargs:
+        results = _scan_segments(full_scan_and_count, table, segments,
+            ConsistentRead=ConsistentRead, **kwargs)
+        count = sum(c for (c, _) in results)
+        items = list(itertools.chain.from_iterable(i for (_, i) in results))
+        return (count, items)
+    kwargs['ConsistentRead'] = ConsistentRead
+    response = table.scan(**kwargs)
     items = []
     count = 0
-    if 'Items' in response:
-        items.extend(response['Items'])
-    if 'Count' in response:
-        count = count + response['Count']
+    items.extend(response.get('Items', []))
+    count += response.get('Count', 0)
     while 'LastEvaluatedKey' in response:
-        response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'],
-            ConsistentRead=ConsistentRead, **kwargs)
-        if 'Items' in response:
-            items.extend(response['Items'])
-        if 'Count' in response:
-            count = count + response['Count']
+        response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'], **kwargs)
+        items.extend(response.get('Items', []))
+        count += response.get('Count', 0)
     return (count, items)
 
+# Run the given scan function (full_scan or full_scan_and_count) separately
+# on each of the given number of segments of the table, in parallel threads,
+# and return the list of per-segment results (ordered by segment number).
+def _scan_segments(func, table, segments, **kwargs):
+    if not isinstance(kwargs.get('FilterExpression', ''), str):
+        raise TypeError(f'{func.__name__}() with segments requires a string FilterExpression')
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        futures = [executor.submit(func, table, Segment=i,
+                       TotalSegments=segments, **kwargs)
+                   for i in range(segments)]
+        return [f.result() for f in futures]
+
+# Use botocore's paginator to run the given operation ('scan' or 'query') on
+# the table, returning an iterator over the response pages. If page_size is
+# given, it is passed as the Limit of each request.
+def _paginate(table, operation, page_size=None, **kwargs):
+    paginator = table.meta.client.get_paginator(operation)
+    if page_size:
+        kwargs['PaginationConfig'] = {'PageSize': page_size}
+    return paginator.paginate(TableName=table.name, **kwargs)
+
 # Utility function for fetching the entire results of a query into an array of items
-def full_query(table, ConsistentRead=True, **kwargs):
-    response = table.query(ConsistentRead=ConsistentRead, **kwargs)
-    items = response['Items']
-    while 'LastEvaluatedKey' in response:
-        response = table.query(ExclusiveStartKey=response['LastEvaluatedKey'],
-            ConsistentRead=ConsistentRead, **kwargs)
-        items.extend(response['Items'])
-    return items
+def full_query(table, ConsistentRead=True, page_size=None, **kwargs):
+    return list(iter_query(table, ConsistentRead, page_size, **kwargs))
+
+# iter_query() is like full_query(), but returns an iterator over the items.
+def iter_query(table, ConsistentRead=True, page_size=None, **kwargs):
+    for page in _paginate(table, 'query', page_size,
+            ConsistentRead=ConsistentRead, **kwargs):
+        yield from page.get('Items', [])
 
 # full_query_and_counts returns both items and counts (pre-filter and
 # post-filter count) as returned by the server.
@@ -82,30 +123,47 @@ def full_query(table, ConsistentRead=True, **kwargs):
 # independently. e.g., with Select='COUNT' the items are not returned, but
 # count is.
 def full_query_and_counts(table, ConsistentRead=True, **kwargs):
-    response = table.query(ConsistentRead=ConsistentRead, **kwargs)
+    kwargs['ConsistentRead'] = ConsistentRead
+    response = table.query(**kwargs)
     items = []
     prefilter_count = 0
     postfilter_count = 0
     pages = 0
-    if 'Items' in response:
-        items.extend(response['Items'])
-        pages = pages + 1
-    if 'Count' in response:
-        postfilter_count = postfilter_count + response['Count']
-    if 'ScannedCount' in response:
-        prefilter_count = prefilter_count + response['ScannedCount']
+    items.extend(response.get('Items', []))
+    postfilter_count += response.get('Count', 0)
+    prefilter_count += response.get('ScannedCount', 0)
+    pages += 1
     while 'LastEvaluatedKey' in response:
-        response = table.query(ExclusiveStartKey=response['LastEvaluatedKey'],
-            ConsistentRead=ConsistentRead, **kwargs)
-        if 'Items' in response:
-            items.extend(response['Items'])
-            pages = pages + 1
-        if 'Count' in response:
-            postfilter_count = postfilter_count + response['Count']
-        if 'ScannedCount' in response:
-            prefilter_count = prefilter_count + response['ScannedCount']
+        response = table.query(ExclusiveStartKey=response['LastEvaluatedKey'], **kwargs)
+        items.extend(response.get('Items', []))
+        postfilter_count += response.get('Count', 0)
+        prefilter_count += response.get('ScannedCount', 0)
+        pages += 1
     return (prefilter_count, postfilter_count, pages, items)
 
+# batch_write() writes many items to one table using BatchWriteItem requests,
+# instead of one PutItem request per item. The items are split into chunks
+# of 25, the maximum which DynamoDB allows in one request, and the chunks are
+# sent in parallel by up to "workers" threads. Items which the server returns
+# as unprocessed are retried, with exponential backoff (as DynamoDB requests)
+# starting at 50ms and up to once a second. Note that the same key must not
+# appear twice in items.
+def batch_write(table, items, workers=8):
+    def write_chunk(chunk):
+        request = {table.name: [{'PutRequest': {'Item': item}} for item in chunk]}
+        delay = 0.05
+        while True:
+            response = table.meta.client.batch_write_item(RequestItems=request)
+            request = response.get('UnprocessedItems')
+            if not request:
+                return
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+    chunks = [items[i:i + 25] for i in range(0, len(items), 25)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() to wait for all chunks, and raise if any of them failed
+        list(executor.map(write_chunk, chunks))
+
 # To compare two lists of items (each is a dict) without regard for order,
 # "==" is not good enough because it will fail if the order is different.
 # The following function, multiset() converts the list into a multiset
@@ -114,13 +172,18 @@ def full_query_and_counts(table, ConsistentRead=True, **kwargs):
 
 def freeze(item):
     if isinstance(item, dict):
-        return frozenset((key, freeze(value)) for key, value in item.items())
+        # Most items are flat, with only scalar (hashable) values, and for
+        # those we can skip the recursive freeze() calls on each value.
+        try:
+            return frozenset(item.items())
+        except TypeError:
+            return frozenset((key, freeze(value)) for key, value in item.items())
     elif isinstance(item, list):
-        return tuple(freeze(value) for value in item)
+        return tuple(map(freeze, item))
     return item
 
 def multiset(items):
-    return collections.Counter([freeze(item) for item in items])
+    return collections.Counter(map(freeze, items))
 
 # NOTE: alternator_Test prefix contains a capital letter on purpose,
 #in order to validate case sensitivity in alternator
@@ -139,14 +202,27 @@ def create_test_table(dynamodb, **kwargs):
     print("fixture creating new table {}".format(name))
     table = dynamodb.create_table(TableName=name,
         BillingMode='PAY_PER_REQUEST', **kwargs)
-    waiter = table.meta.client.get_waiter('table_exists')
-    # recheck every second instead of the default, lower, frequency. This can
-    # save a few seconds on AWS with its very slow table creation, but can
-    # more on tests on Scylla with its faster table creation turnaround.
-    waiter.config.delay = 1
-    waiter.config.max_attempts = 200
-    waiter.wait(TableName=name)
-    return table
+    # Wait for the table to become ACTIVE. Instead of using boto3's waiter,
+    # which rechecks at a fixed (and, by default, low) frequency, we poll
+    # with exponential backoff - starting at 50ms and up to once a second.
+    # This saves time in tests on Scylla with its fast table creation, and
+    # is still frequent enough on AWS with its very slow table creation.
+    deadline = time.monotonic() + 200
+    delay = 0.05
+    # Like boto3's waiter, treat ResourceNotFoundException as "not yet", as
+    # the node answering DescribeTable may not have seen the new table yet.
+    while True:
+        try:
+            response = table.meta.client.describe_table(TableName=name)
+            if response['Table']['TableStatus'] == 'ACTIVE':
+                return table
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"table {name} did not become ACTIVE")
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
 
 # A variant of create_test_table() that can be used in a "with" to
 # automatically delete the table when the test ends - as:
@@ -176,18 +252,17 @@ def list_tables(dynamodb, limit=100):
     pos = None
     while True:
         if pos:
-            page = dynamodb.meta.client.list_tables(Limit=limit, ExclusiveStartTableName=pos);
+            page = dynamodb.meta.client.list_tables(Limit=limit, ExclusiveStartTableName=pos)
         else:
-            page = dynamodb.meta.client.list_tables(Limit=limit);
+            page = dynamodb.meta.client.list_tables(Limit=limit)
         results = page.get('TableNames', None)
-        assert(results)
-        ret = ret + results
-        newpos = page.get('LastEvaluatedTableName', None)
-        if not newpos:
-            break;
         # It doesn't make sense for Dynamo to tell us we need more pages, but
         # not send anything in *this* page!
-        assert len(results) > 0
+        assert results
+        ret.extend(results)
+        newpos = page.get('LastEvaluatedTableName', None)
+        if not newpos:
+            break
         assert newpos != pos
         # Note that we only checked that we got back tables, not that we got
         # any new tables not already in ret. So a buggy implementation might
@@ -195,6 +270,16 @@ def list_tables(dynamodb, limit=100):
         pos = newpos
     return ret
 
+# An empty event emitter, used by client_no_transform() below. All uses share
+# the same emitter, so it must remain empty: a hook registered on it would
+# leak to all later uses, so this is forbidden.
+class _NullEmitter(HierarchicalEmitter):
+    def register(self, *args, **kwargs):
+        raise RuntimeError('Cannot register hooks on client_no_transform() client')
+    register_first = register
+    register_last = register
+_null_emitter = _NullEmitter()
+
 # Boto3 conveniently transforms native Python types to DynamoDB JSON and back,
 # for example one can use the string 'x' as a key and it is transparently
 # transformed to the map {'S': 'x'} that Boto3 uses to represent a string.
@@ -209,6 +294,10 @@ def client_no_transform(client):
     # by default boto3 sets up as explained above. Here we temporarily
     # override it with an empty emitter:
     old_events = client.meta.events
-    client.meta.events = HierarchicalEmitter()
-    yield client
-    client.meta.events = old_events
+    client.meta.events = _null_emitter
+    try:
+        yield client
+    finally:
+        # Restore the hooks even if the test failed, because the client is
+        # shared with all other tests.
+        client.meta.events = old_events